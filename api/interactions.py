@@ -7,6 +7,7 @@ load_dotenv()
 
 from utils.discord_helpers import verify_signature
 from utils.price import handle_price_command
+from utils.haul import handle_haul_command
 
 app = Flask(__name__)
 
@@ -40,8 +41,9 @@ def interactions():
         app_id = os.environ["DISCORD_APP_ID"]
         token = data["token"]
 
+        options = {opt["name"]: opt["value"] for opt in data["data"].get("options", [])}
+
         if command_name == "price":
-            options = {opt["name"]: opt["value"] for opt in data["data"].get("options", [])}
             system = options.get("system", "")
             item = options.get("item", "")
 
@@ -53,4 +55,15 @@ def interactions():
             )
             return response
 
+        if command_name == "haul":
+            system = options.get("system", "")
+            cargo = options.get("cargo", 0)
+            capital = options.get("capital", "")
+
+            response = jsonify({"type": 5})
+            response.call_on_close(
+                lambda: handle_haul_command(system, cargo, capital, app_id, token)
+            )
+            return response
+
     return "Unknown interaction type", 400
@@ -0,0 +1,38 @@
+"""Run the shared ESI worker service for sharded bot processes.
+
+Usage:
+    python esi_service.py
+
+Listens on ESI_SERVICE_SOCKET (default: a socket in this user's private
+directory under the temp directory). Refuses to start if another service
+is already answering there.
+ESI_SERVICE_PROCESSES sets the size of the order reduction pool
+(default: one per CPU).
+"""
+
+import asyncio
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.service import serve, default_socket_path
+
+
+def main():
+    path = default_socket_path()
+    processes = os.getenv("ESI_SERVICE_PROCESSES")
+    print(f"ESI service listening on {path}")
+    try:
+        asyncio.run(serve(path, int(processes) if processes else None))
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
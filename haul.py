@@ -0,0 +1,49 @@
+import sys
+
+from utils.esi import resolve_system_id, get_jumps, format_isk, JITA_SYSTEM_ID
+from utils.haul import find_haul, check_cargo, parse_isk
+
+
+def main():
+    if len(sys.argv) < 4:
+        print("Usage: python haul.py <system_name> <cargo_m3> <capital_isk>")
+        print("Example: python haul.py Amarr 60000 500m")
+        sys.exit(1)
+
+    system_name = " ".join(sys.argv[1:-2])
+    try:
+        cargo = check_cargo(float(sys.argv[-2]))
+        capital = parse_isk(sys.argv[-1])
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    print(f"Resolving system: {system_name}")
+    system_id, system_name = resolve_system_id(system_name)
+    jumps = get_jumps(system_id, JITA_SYSTEM_ID)
+
+    print("Fetching sell orders here and buy orders in Jita...")
+    picks, names, skipped = find_haul(system_id, cargo, capital)
+    if skipped:
+        print(f"Skipped {skipped} items while looking up volumes; run again for a fuller plan.")
+
+    if not picks:
+        print("No profitable items to haul to Jita.")
+        return
+
+    j = f" ({jumps} jumps)" if jumps is not None else ""
+    print(f"\n--- {system_name} -> Jita{j} ---")
+    for pick in picks:
+        print(
+            f"{names.get(pick['type_id'], pick['type_id'])}: "
+            f"{pick['units']:,} units, {pick['volume']:,.2f} m3, "
+            f"cost {format_isk(pick['cost'])}, profit {format_isk(pick['profit'])}"
+        )
+
+    print(f"\nCargo used: {sum(p['volume'] for p in picks):,.2f} / {cargo:,.2f} m3")
+    print(f"Capital used: {format_isk(sum(p['cost'] for p in picks))} / {format_isk(capital)}")
+    print(f"Profit (before taxes): {format_isk(sum(p['profit'] for p in picks))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,31 @@ COMMANDS = [
             },
         ],
     },
+    {
+        "name": "haul",
+        "description": "Find the most profitable items to haul from a system to Jita",
+        "type": 1,  # CHAT_INPUT
+        "options": [
+            {
+                "name": "system",
+                "description": "K-space system to buy in (e.g. Amarr, Dodixie, Hek)",
+                "type": 3,  # STRING
+                "required": True,
+            },
+            {
+                "name": "cargo",
+                "description": "Cargo capacity in m\u00b3",
+                "type": 10,  # NUMBER
+                "required": True,
+            },
+            {
+                "name": "capital",
+                "description": "ISK to spend (e.g. 500m, 1.5b)",
+                "type": 3,  # STRING
+                "required": True,
+            },
+        ],
+    },
 ]
 
 resp = requests.put(
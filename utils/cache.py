@@ -0,0 +1,358 @@
+import asyncio
+import functools
+import getpass
+import inspect
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# ESI market orders are refreshed every 5 minutes; stale results are served
+# for at most one more cycle while they refresh.
+PRICE_FRESH_TTL = 300
+PRICE_STALE_TTL = 600
+
+
+class ResultCache:
+    """Stale-while-revalidate cache for finished command results.
+
+    Entries younger than ``fresh_ttl`` are served as-is. Entries between
+    ``fresh_ttl`` and ``stale_ttl`` are still served, but the caller should
+    claim a refresh with ``begin_refresh`` and store the new result.
+    At most ``max_entries`` are kept, least recently used dropped first.
+    """
+
+    def __init__(self, fresh_ttl: float = PRICE_FRESH_TTL,
+                 stale_ttl: float = PRICE_STALE_TTL, max_entries: int = 1024):
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> tuple[dict, float] | None:
+        """Return ``(value, age)`` if the entry is within the stale window."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            age = time.time() - stored_at
+            if age > self.stale_ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value, age
+
+    def set(self, key, value: dict):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            self._refreshing.discard(key)
+            if len(self._entries) > self.max_entries:
+                expired = [k for k, (stored_at, _) in self._entries.items()
+                           if now - stored_at > self.stale_ttl]
+                for k in expired:
+                    del self._entries[k]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def is_fresh(self, age: float) -> bool:
+        return age <= self.fresh_ttl
+
+    def begin_refresh(self, key) -> bool:
+        """Claim the refresh for ``key``. Only one caller gets True."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+
+def format_age(seconds: float) -> str:
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m"
+    return f"{int(seconds // 3600)}h"
+
+
+def with_data_age(embed: dict, age: float) -> dict:
+    """Return a copy of an embed dict with the data age in its footer."""
+    embed = dict(embed)
+    embed["footer"] = {"text": f"Data from EVE ESI • {format_age(age)} old"}
+    return embed
+
+
+# --- Persistent ESI lookup cache ---
+#
+# Backends share one interface: ``get(key)`` returns ``(value, expires_at)``
+# or None, ``set(key, value, expires_at)`` stores an entry and ``evict()``
+# drops expired entries in bulk.
+
+STATIC_TTL = 7 * 86400  # names, IDs, regions and type volumes
+ROUTE_TTL = 86400
+
+
+class MemoryCache:
+    """In-process LRU cache, used as an L1 in front of a persistent backend."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[object, float] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value, expires_at: float):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                # Drop the least recently used quarter in one go.
+                for _ in range(len(self._entries) - self.max_entries * 3 // 4):
+                    self._entries.popitem(last=False)
+
+    def evict(self):
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, exp) in self._entries.items() if exp <= now]
+            for key in expired:
+                del self._entries[key]
+
+
+class SQLiteCache:
+    """SQLite cache file in WAL mode, shareable between processes.
+
+    Values are stored as compact JSON, with top-level lists read back as
+    tuples. Expired entries are deleted in bulk every ``evict_every`` writes,
+    and the entries closest to expiry are trimmed when the table grows past
+    ``max_entries``. The cache is best-effort: a locked or failing database
+    reads as a miss and skips the write.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000, evict_every: int = 256):
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> tuple[object, float] | None:
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM cache WHERE key = ?", (key,),
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or row[1] <= time.time():
+            return None
+        try:
+            value = json.loads(row[0])
+        except ValueError:
+            return None
+        return (tuple(value) if isinstance(value, list) else value), row[1]
+
+    def set(self, key: str, value, expires_at: float):
+        blob = json.dumps(value, separators=(",", ":")).encode()
+        try:
+            with self._lock:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, blob, expires_at),
+                    )
+                    self._conn.commit()
+                except sqlite3.Error:
+                    self._conn.rollback()
+                    raise
+                self._writes += 1
+                due = self._writes % self.evict_every == 0
+        except sqlite3.Error:
+            return
+        if due:
+            self.evict()
+
+    def evict(self):
+        try:
+            with self._lock:
+                try:
+                    self._conn.execute(
+                        "DELETE FROM cache WHERE expires_at <= ?", (time.time(),),
+                    )
+                    (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+                    excess = count - self.max_entries * 3 // 4
+                    if count > self.max_entries and excess > 0:
+                        self._conn.execute(
+                            "DELETE FROM cache WHERE key IN ("
+                            " SELECT key FROM cache ORDER BY expires_at LIMIT ?)",
+                            (excess,),
+                        )
+                    self._conn.commit()
+                except sqlite3.Error:
+                    self._conn.rollback()
+                    raise
+        except sqlite3.Error:
+            pass
+
+
+class TieredCache:
+    """An in-memory L1 in front of a slower shared backend."""
+
+    def __init__(self, l1: MemoryCache, l2):
+        self.l1 = l1
+        self.l2 = l2
+
+    def get(self, key: str) -> tuple[object, float] | None:
+        entry = self.l1.get(key)
+        if entry is None:
+            entry = self.l2.get(key)
+            if entry is not None:
+                self.l1.set(key, *entry)
+        return entry
+
+    def set(self, key: str, value, expires_at: float):
+        self.l1.set(key, value, expires_at)
+        self.l2.set(key, value, expires_at)
+
+    def evict(self):
+        self.l1.evict()
+        self.l2.evict()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def private_dir(path: str) -> str:
+    """Create ``path`` with 0700 permissions and check nobody else can write to it."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.stat(path)
+    if (hasattr(os, "getuid") and st.st_uid != os.getuid()) or st.st_mode & 0o077:
+        raise OSError(f"Directory is not private: {path}")
+    return path
+
+
+def user_temp_dir() -> str:
+    """Return this user's directory under the temp dir (not yet created)."""
+    user = os.getuid() if hasattr(os, "getuid") else getpass.getuser()
+    return os.path.join(tempfile.gettempdir(), f"eve-market-{user}")
+
+
+def default_cache_path() -> str:
+    """Return ``ESI_CACHE_PATH``, or a file in a per-user cache directory.
+
+    Uses ``$XDG_CACHE_HOME`` (or ``~/.cache``), falling back to a per-user
+    directory in the temp dir when the home directory is not writable.
+    Raises OSError if no private directory can be set up.
+    """
+    if os.environ.get("ESI_CACHE_PATH"):
+        return os.environ["ESI_CACHE_PATH"]
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    for directory in (os.path.join(cache_home, "eve-market"), user_temp_dir()):
+        try:
+            return os.path.join(private_dir(directory), "cache.sqlite3")
+        except OSError:
+            continue
+    raise OSError("No private directory for the ESI cache")
+
+
+def get_cache():
+    """Return the process-wide cache backend, creating it on first use.
+
+    Uses ``ESI_CACHE_PATH`` (default: a per-user cache directory) with an
+    in-memory L1 unless ``ESI_CACHE_L1=0``. Falls back to memory only if the
+    file cannot be opened, e.g. on a read-only filesystem.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            try:
+                backend = SQLiteCache(default_cache_path())
+            except (sqlite3.Error, OSError):
+                backend = MemoryCache()
+            else:
+                if os.environ.get("ESI_CACHE_L1", "1") != "0":
+                    backend = TieredCache(MemoryCache(), backend)
+            _backend = backend
+        return _backend
+
+
+def set_cache(backend):
+    """Replace the process-wide cache backend."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def cached(namespace: str, ttl: float):
+    """Cache a lookup's results in the shared backend, keyed by its arguments.
+
+    Works for both plain and async functions; for async ones the backend is
+    accessed in the default executor so SQLite never blocks the event loop.
+    None results are not cached.
+    """
+    def decorator(func):
+        def make_key(args) -> str:
+            return f"{namespace}:{':'.join(map(str, args))}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args):
+                key = make_key(args)
+                loop = asyncio.get_running_loop()
+                backend = get_cache()
+                entry = await loop.run_in_executor(None, backend.get, key)
+                if entry is not None:
+                    return entry[0]
+                value = await func(*args)
+                if value is not None:
+                    await loop.run_in_executor(
+                        None, backend.set, key, value, time.time() + ttl,
+                    )
+                return value
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = make_key(args)
+            entry = get_cache().get(key)
+            if entry is not None:
+                return entry[0]
+            value = func(*args)
+            if value is not None:
+                get_cache().set(key, value, time.time() + ttl)
+            return value
+        return wrapper
+    return decorator
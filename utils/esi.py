@@ -1,9 +1,17 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
+from utils.cache import cached, STATIC_TTL, ROUTE_TTL
+
 ESI_BASE = "https://esi.evetech.net/latest"
 HEADERS = {"User-Agent": "eve-wh-market-bot/1.0"}
 JITA_SYSTEM_ID = 30000142
 THE_FORGE_REGION_ID = 10000002
+# Per-request timeout (seconds), so a hung ESI call can't outlive a
+# serverless invocation.
+ESI_TIMEOUT = 10
 
 session = requests.Session()
 session.headers.update(HEADERS)
@@ -11,18 +19,48 @@ session.headers.update(HEADERS)
 
 def esi_get(endpoint: str, params: dict | None = None):
     url = f"{ESI_BASE}{endpoint}"
-    resp = session.get(url, params=params)
+    resp = session.get(url, params=params, timeout=ESI_TIMEOUT)
     resp.raise_for_status()
     return resp.json()
 
 
 def esi_post(endpoint: str, json_body):
     url = f"{ESI_BASE}{endpoint}"
-    resp = session.post(url, json=json_body)
+    resp = session.post(url, json=json_body, timeout=ESI_TIMEOUT)
     resp.raise_for_status()
     return resp.json()
 
 
+def esi_get_pages(endpoint: str, params: dict | None = None) -> list:
+    """Fetch every page of a paginated endpoint, pages after the first in parallel.
+
+    A later page that 404s (ESI's page cache expiring mid-fetch) is dropped
+    instead of throwing away the pages already fetched.
+    """
+    params = dict(params or {})
+    resp = session.get(
+        f"{ESI_BASE}{endpoint}", params={**params, "page": 1}, timeout=ESI_TIMEOUT,
+    )
+    resp.raise_for_status()
+    results = resp.json()
+    pages = int(resp.headers.get("X-Pages", 1))
+
+    def get_page(n: int) -> list:
+        try:
+            return esi_get(endpoint, params={**params, "page": n})
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return []
+            raise
+
+    if pages > 1:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            for page in pool.map(get_page, range(2, pages + 1)):
+                results.extend(page)
+    return results
+
+
+@cached("system_id", STATIC_TTL)
 def resolve_system_id(system_name: str) -> tuple[int, str]:
     data = esi_post("/universe/ids/", [system_name])
     systems = data.get("systems")
@@ -31,6 +69,7 @@ def resolve_system_id(system_name: str) -> tuple[int, str]:
     return systems[0]["id"], systems[0]["name"]
 
 
+@cached("type_id", STATIC_TTL)
 def resolve_type_id(item_name: str) -> tuple[int, str]:
     data = esi_post("/universe/ids/", [item_name])
     types = data.get("inventory_types")
@@ -39,6 +78,7 @@ def resolve_type_id(item_name: str) -> tuple[int, str]:
     return types[0]["id"], types[0]["name"]
 
 
+@cached("region", STATIC_TTL)
 def get_region_for_system(system_id: int) -> tuple[int, str]:
     system_info = esi_get(f"/universe/systems/{system_id}/")
     constellation_id = system_info["constellation_id"]
@@ -48,15 +88,56 @@ def get_region_for_system(system_id: int) -> tuple[int, str]:
     return region_id, region_info["name"]
 
 
-def get_best_prices(region_id: int, type_id: int, system_id: int) -> dict:
-    """Return best prices for system and region, plus location system IDs."""
+def reduce_orders(orders: list, system_id: int, result: dict | None = None) -> dict:
+    """Fold a page of orders into best system and region prices."""
+    if result is None:
+        result = {
+            "sys_buy": None, "sys_sell": None,
+            "reg_buy": None, "reg_sell": None,
+            "reg_buy_system": None, "reg_sell_system": None,
+            "reg_buy_vol": 0, "reg_sell_vol": 0,
+        }
+    for order in orders:
+        price = order["price"]
+        vol = order["volume_remain"]
+        in_system = order["system_id"] == system_id
+        if order["is_buy_order"]:
+            if result["reg_buy"] is None or price > result["reg_buy"]:
+                result["reg_buy"] = price
+                result["reg_buy_system"] = order["system_id"]
+                result["reg_buy_vol"] = vol
+            if in_system and (result["sys_buy"] is None or price > result["sys_buy"]):
+                result["sys_buy"] = price
+        else:
+            if result["reg_sell"] is None or price < result["reg_sell"]:
+                result["reg_sell"] = price
+                result["reg_sell_system"] = order["system_id"]
+                result["reg_sell_vol"] = vol
+            if in_system and (result["sys_sell"] is None or price < result["sys_sell"]):
+                result["sys_sell"] = price
+    return result
+
+
+def reduce_order_pages(pages: list[bytes], system_id: int) -> dict:
+    """Decode raw order pages and fold them into best prices.
+
+    Takes undecoded bodies so a worker process can do the JSON decoding too.
+    """
+    result = reduce_orders([], system_id)
+    for page in pages:
+        reduce_orders(json.loads(page), system_id, result)
+    return result
+
+
+def get_best_prices(region_id: int, type_id: int, system_id: int) -> tuple[dict, bool]:
+    """Return best prices for system and region, plus location system IDs.
+
+    Also returns whether every order page was fetched: a 404 after the first
+    page (ESI's page cache expiring mid-fetch) keeps the earlier pages.
+    """
     page = 1
-    result = {
-        "sys_buy": None, "sys_sell": None,
-        "reg_buy": None, "reg_sell": None,
-        "reg_buy_system": None, "reg_sell_system": None,
-        "reg_buy_vol": 0, "reg_sell_vol": 0,
-    }
+    result = reduce_orders([], system_id)
+    complete = True
     while True:
         try:
             orders = esi_get(
@@ -65,32 +146,17 @@ def get_best_prices(region_id: int, type_id: int, system_id: int) -> dict:
             )
         except requests.HTTPError as e:
             if e.response is not None and e.response.status_code == 404:
+                complete = page == 1
                 break
             raise
         if not orders:
             break
-        for order in orders:
-            price = order["price"]
-            vol = order["volume_remain"]
-            in_system = order["system_id"] == system_id
-            if order["is_buy_order"]:
-                if result["reg_buy"] is None or price > result["reg_buy"]:
-                    result["reg_buy"] = price
-                    result["reg_buy_system"] = order["system_id"]
-                    result["reg_buy_vol"] = vol
-                if in_system and (result["sys_buy"] is None or price > result["sys_buy"]):
-                    result["sys_buy"] = price
-            else:
-                if result["reg_sell"] is None or price < result["reg_sell"]:
-                    result["reg_sell"] = price
-                    result["reg_sell_system"] = order["system_id"]
-                    result["reg_sell_vol"] = vol
-                if in_system and (result["sys_sell"] is None or price < result["sys_sell"]):
-                    result["sys_sell"] = price
+        reduce_orders(orders, system_id, result)
         page += 1
-    return result
+    return result, complete
 
 
+@cached("jumps", ROUTE_TTL)
 def get_jumps(origin: int, destination: int) -> int | None:
     """Return number of jumps between two k-space systems, or None."""
     if origin == destination:
@@ -102,15 +168,32 @@ def get_jumps(origin: int, destination: int) -> int | None:
         return None
 
 
+@cached("system_name", STATIC_TTL)
 def get_system_name(system_id: int) -> str:
     info = esi_get(f"/universe/systems/{system_id}/")
     return info["name"]
 
 
+@cached("type_volume", STATIC_TTL)
 def get_type_volume(type_id: int) -> float:
     info = esi_get(f"/universe/types/{type_id}/")
     return info.get("volume", 0.0)
 
 
+@cached("type_haul_volume", STATIC_TTL)
+def get_type_haul_volume(type_id: int) -> float:
+    """Return the volume an item takes in cargo: packaged if it has one."""
+    info = esi_get(f"/universe/types/{type_id}/")
+    return info.get("packaged_volume", info.get("volume", 0.0))
+
+
+def get_type_names(type_ids: list[int]) -> dict[int, str]:
+    names = {}
+    for i in range(0, len(type_ids), 1000):
+        for entry in esi_post("/universe/names/", type_ids[i:i + 1000]):
+            names[entry["id"]] = entry["name"]
+    return names
+
+
 def format_isk(value: float) -> str:
     return f"{value:,.2f} ISK"
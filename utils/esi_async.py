@@ -0,0 +1,291 @@
+"""Async ESI helpers shared by the bot and the ESI worker service.
+
+Call ``open_session`` before use. Market order pages are fetched as raw
+bodies and decoded and reduced in ``executor`` (a process pool in the
+worker service, the default thread pool otherwise), so neither the JSON
+decoding nor the reductions block the event loop.
+"""
+
+import asyncio
+import time
+
+import aiohttp
+
+from utils.cache import ResultCache, cached, STATIC_TTL, ROUTE_TTL
+from utils.esi import (
+    ESI_BASE, HEADERS, JITA_SYSTEM_ID, THE_FORGE_REGION_ID, reduce_order_pages,
+)
+from utils.haul import (
+    find_candidates_in_pages, plan_haul, build_haul_embed, HAUL_TIME_BUDGET,
+)
+from utils.price import build_price_embed
+
+MAX_CONCURRENT_REQUESTS = 20
+# Pause when ESI's error budget runs this low, until the window resets.
+ERROR_LIMIT_FLOOR = 10
+
+session: aiohttp.ClientSession | None = None
+executor = None
+price_cache = ResultCache()
+_limiter: asyncio.Semaphore | None = None
+_paused_until = 0.0
+_background_tasks: set[asyncio.Task] = set()
+
+
+async def open_session(pool=None):
+    """Create the shared HTTP session. ``pool`` runs order reductions."""
+    global session, executor, _limiter
+    session = aiohttp.ClientSession(headers=HEADERS)
+    executor = pool
+    _limiter = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+
+async def close_session():
+    if session:
+        await session.close()
+
+
+async def run_cpu(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+async def _request(method: str, endpoint: str, raw: bool = False, **kwargs):
+    global _paused_until
+    async with _limiter:
+        delay = _paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with session.request(method, f"{ESI_BASE}{endpoint}", **kwargs) as resp:
+            remain = resp.headers.get("X-ESI-Error-Limit-Remain")
+            if remain is not None and int(remain) < ERROR_LIMIT_FLOOR:
+                reset = int(resp.headers.get("X-ESI-Error-Limit-Reset", 1))
+                _paused_until = time.monotonic() + reset
+            resp.raise_for_status()
+            if raw:
+                return await resp.read(), resp.headers
+            return await resp.json(), resp.headers
+
+
+async def esi_get(endpoint: str, params: dict | None = None) -> dict | list:
+    data, _ = await _request("GET", endpoint, params=params)
+    return data
+
+
+async def esi_post(endpoint: str, json_body) -> dict:
+    data, _ = await _request("POST", endpoint, json=json_body)
+    return data
+
+
+async def esi_get_page_bodies(endpoint: str, params: dict | None = None) -> tuple[list[bytes], bool]:
+    """Fetch every page of a paginated endpoint as raw, undecoded bodies.
+
+    Returns the bodies and whether every page was fetched. A later page
+    that 404s (ESI's page cache expiring mid-fetch) is dropped instead of
+    throwing away the pages already fetched.
+    """
+    params = dict(params or {})
+    first, headers = await _request("GET", endpoint, raw=True, params={**params, "page": 1})
+    pages = int(headers.get("X-Pages", 1))
+    rest = await asyncio.gather(*(
+        _request("GET", endpoint, raw=True, params={**params, "page": n})
+        for n in range(2, pages + 1)
+    ), return_exceptions=True)
+    bodies, complete = [first], True
+    for page in rest:
+        if isinstance(page, aiohttp.ClientResponseError) and page.status == 404:
+            complete = False
+        elif isinstance(page, BaseException):
+            raise page
+        else:
+            bodies.append(page[0])
+    return bodies, complete
+
+
+@cached("system_id", STATIC_TTL)
+async def resolve_system_id(system_name: str) -> tuple[int, str]:
+    data = await esi_post("/universe/ids/", [system_name])
+    systems = data.get("systems")
+    if not systems:
+        raise ValueError(f"System not found: **{system_name}**")
+    return systems[0]["id"], systems[0]["name"]
+
+
+@cached("type_id", STATIC_TTL)
+async def resolve_type_id(item_name: str) -> tuple[int, str]:
+    data = await esi_post("/universe/ids/", [item_name])
+    types = data.get("inventory_types")
+    if not types:
+        raise ValueError(f"Item not found: **{item_name}**")
+    return types[0]["id"], types[0]["name"]
+
+
+@cached("region", STATIC_TTL)
+async def get_region_for_system(system_id: int) -> tuple[int, str]:
+    system_info = await esi_get(f"/universe/systems/{system_id}/")
+    constellation_id = system_info["constellation_id"]
+    constellation_info = await esi_get(f"/universe/constellations/{constellation_id}/")
+    region_id = constellation_info["region_id"]
+    region_info = await esi_get(f"/universe/regions/{region_id}/")
+    return region_id, region_info["name"]
+
+
+async def get_best_prices(region_id: int, type_id: int, system_id: int) -> tuple[dict, bool]:
+    """Return best prices for system and region, plus location system IDs.
+
+    Also returns whether every order page was fetched.
+    """
+    try:
+        pages, complete = await esi_get_page_bodies(
+            f"/markets/{region_id}/orders/",
+            params={"order_type": "all", "type_id": type_id},
+        )
+    except aiohttp.ClientResponseError as e:
+        if e.status != 404:
+            raise
+        pages, complete = [], True
+    return await run_cpu(reduce_order_pages, pages, system_id), complete
+
+
+@cached("jumps", ROUTE_TTL)
+async def get_jumps(origin: int, destination: int) -> int | None:
+    """Return number of jumps between two k-space systems, or None."""
+    if origin == destination:
+        return 0
+    try:
+        route = await esi_get(f"/route/{origin}/{destination}/")
+        return len(route) - 1
+    except aiohttp.ClientResponseError:
+        return None
+
+
+@cached("system_name", STATIC_TTL)
+async def get_system_name(system_id: int) -> str:
+    info = await esi_get(f"/universe/systems/{system_id}/")
+    return info["name"]
+
+
+@cached("type_volume", STATIC_TTL)
+async def get_type_volume(type_id: int) -> float:
+    info = await esi_get(f"/universe/types/{type_id}/")
+    return info.get("volume", 0.0)
+
+
+@cached("type_haul_volume", STATIC_TTL)
+async def get_type_haul_volume(type_id: int) -> float:
+    """Return the volume an item takes in cargo: packaged if it has one."""
+    info = await esi_get(f"/universe/types/{type_id}/")
+    return info.get("packaged_volume", info.get("volume", 0.0))
+
+
+async def get_type_names(type_ids: list[int]) -> dict[int, str]:
+    names = {}
+    for i in range(0, len(type_ids), 1000):
+        for entry in await esi_post("/universe/names/", type_ids[i:i + 1000]):
+            names[entry["id"]] = entry["name"]
+    return names
+
+
+async def order_location(system_id: int, order_system_id: int | None):
+    """Return ``(system_name, jumps)`` for an order's system, or None."""
+    if order_system_id is None:
+        return None
+    return await asyncio.gather(
+        get_system_name(order_system_id), get_jumps(system_id, order_system_id),
+    )
+
+
+async def fetch_price_result(system_id: int, system_name: str,
+                             type_id: int, type_name: str) -> tuple[dict, bool]:
+    """Run the ESI lookups for /price and return the embed with its prices.
+
+    Also returns whether all order pages were fetched; partial results are
+    fine to show but must not be cached.
+    """
+    region_id, region_name = await get_region_for_system(system_id)
+
+    (reg, reg_complete), (jita, jita_complete), volume, jita_jumps = await asyncio.gather(
+        get_best_prices(region_id, type_id, system_id),
+        get_best_prices(THE_FORGE_REGION_ID, type_id, JITA_SYSTEM_ID),
+        get_type_volume(type_id),
+        get_jumps(system_id, JITA_SYSTEM_ID),
+    )
+    sell_loc, buy_loc = await asyncio.gather(
+        order_location(system_id, reg["reg_sell_system"]),
+        order_location(system_id, reg["reg_buy_system"]),
+    )
+    embed = build_price_embed(
+        type_name, volume, system_name, region_name, reg, jita, jita_jumps,
+        sell_loc, buy_loc,
+    )
+    return {"embed": embed, "reg": reg, "jita": jita}, reg_complete and jita_complete
+
+
+async def _refresh_price_result(key: tuple[int, int], system_name: str, type_name: str):
+    try:
+        result, complete = await fetch_price_result(key[0], system_name, key[1], type_name)
+        if complete:
+            price_cache.set(key, result)
+    except Exception:
+        pass  # keep serving the stale entry
+    finally:
+        price_cache.end_refresh(key)
+
+
+async def price_result(system_id: int, system_name: str,
+                       type_id: int, type_name: str) -> tuple[dict, float]:
+    """Return ``(result, age)`` for /price, serving cached results while they last.
+
+    A stale hit is returned immediately and refreshed in the background.
+    Freshly fetched results have an age of 0.
+    """
+    key = (system_id, type_id)
+    cached_result = price_cache.get(key)
+    if cached_result is not None:
+        result, age = cached_result
+        if not price_cache.is_fresh(age) and price_cache.begin_refresh(key):
+            task = asyncio.create_task(_refresh_price_result(key, system_name, type_name))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        return result, age
+
+    result, complete = await fetch_price_result(system_id, system_name, type_id, type_name)
+    if complete:
+        price_cache.set(key, result)
+    return result, 0.0
+
+
+async def haul_embed(system_id: int, system_name: str, cargo: float, capital: float) -> dict:
+    """Plan a haul from ``system_id`` to Jita and return it as an embed dict.
+
+    Volume lookups that fail or run past the time budget are left out and
+    counted in the embed.
+    """
+    deadline = time.monotonic() + HAUL_TIME_BUDGET
+    region_id, _ = await get_region_for_system(system_id)
+
+    (source_pages, _), (dest_pages, _), jumps = await asyncio.gather(
+        esi_get_page_bodies(f"/markets/{region_id}/orders/", {"order_type": "sell"}),
+        esi_get_page_bodies(f"/markets/{THE_FORGE_REGION_ID}/orders/", {"order_type": "buy"}),
+        get_jumps(system_id, JITA_SYSTEM_ID),
+    )
+    candidates = await run_cpu(
+        find_candidates_in_pages, source_pages, system_id, dest_pages, JITA_SYSTEM_ID,
+    )
+    tasks = {
+        asyncio.create_task(get_type_haul_volume(type_id)): type_id
+        for type_id in candidates
+    }
+    volumes = {}
+    if tasks:
+        done, pending = await asyncio.wait(
+            tasks, timeout=max(deadline - time.monotonic(), 0),
+        )
+        for task in pending:
+            task.cancel()
+        volumes = {tasks[t]: t.result() for t in done if t.exception() is None}
+    skipped = len(candidates) - len(volumes)
+    candidates = {type_id: candidates[type_id] for type_id in volumes}
+
+    picks = await run_cpu(plan_haul, candidates, volumes, cargo, capital)
+    names = await get_type_names([p["type_id"] for p in picks]) if picks else {}
+    return build_haul_embed(system_name, jumps, cargo, capital, picks, names, skipped)
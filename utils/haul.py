@@ -0,0 +1,276 @@
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from utils.esi import (
+    resolve_system_id, get_region_for_system, esi_get_pages, get_jumps,
+    get_type_haul_volume, get_type_names, format_isk, JITA_SYSTEM_ID, THE_FORGE_REGION_ID,
+)
+from utils.discord_helpers import edit_original_response
+
+MAX_HAUL_FIELDS = 10
+# Only the most promising types get their volume looked up.
+MAX_HAUL_CANDIDATES = 500
+# Seconds /haul may spend before replying; Vercel kills the function at 60.
+HAUL_TIME_BUDGET = 40
+ISK_SUFFIXES = {"k": 1e3, "m": 1e6, "b": 1e9}
+
+
+def parse_isk(amount) -> float:
+    """Parse an ISK amount such as ``250000000``, ``250m`` or ``1.5b``."""
+    text = str(amount).strip().lower().replace(",", "").removesuffix("isk").strip()
+    multiplier = 1.0
+    if text and text[-1] in ISK_SUFFIXES:
+        multiplier = ISK_SUFFIXES[text[-1]]
+        text = text[:-1]
+    try:
+        value = float(text) * multiplier
+    except ValueError:
+        raise ValueError(f"Invalid ISK amount: **{amount}**") from None
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError("ISK amount must be a positive number")
+    return value
+
+
+def check_cargo(cargo: float) -> float:
+    if not math.isfinite(cargo) or cargo <= 0:
+        raise ValueError("Cargo must be a positive number")
+    return cargo
+
+
+def order_books(orders: list, system_id: int, is_buy: bool) -> dict[int, list]:
+    """Group one side of a region's orders in a system by type, best price first."""
+    books = {}
+    for order in orders:
+        if order["system_id"] != system_id or order["is_buy_order"] != is_buy:
+            continue
+        # Buy orders with a minimum volume can't be filled piecemeal.
+        if is_buy and order.get("min_volume", 1) > 1:
+            continue
+        books.setdefault(order["type_id"], []).append(
+            (order["price"], order["volume_remain"])
+        )
+    for book in books.values():
+        book.sort(reverse=is_buy)
+    return books
+
+
+def profit_segments(asks: list, bids: list) -> list[tuple[int, float, float]]:
+    """Match asks (cheapest first) against bids (highest first).
+
+    Returns ``(units, buy_price, sell_price)`` runs for as long as buying
+    from the ask and selling into the bid is profitable. Profit per unit
+    never increases from one run to the next.
+    """
+    segments = []
+    i = j = 0
+    ask_left = asks[0][1] if asks else 0
+    bid_left = bids[0][1] if bids else 0
+    while i < len(asks) and j < len(bids):
+        buy, sell = asks[i][0], bids[j][0]
+        if sell <= buy:
+            break
+        units = min(ask_left, bid_left)
+        segments.append((units, buy, sell))
+        ask_left -= units
+        bid_left -= units
+        if ask_left == 0:
+            i += 1
+            ask_left = asks[i][1] if i < len(asks) else 0
+        if bid_left == 0:
+            j += 1
+            bid_left = bids[j][1] if j < len(bids) else 0
+    return segments
+
+
+def find_candidates(source_orders: list, source_system: int,
+                    dest_orders: list, dest_system: int) -> dict[int, list]:
+    """Return profit segments for every type that can be hauled at a profit."""
+    asks = order_books(source_orders, source_system, is_buy=False)
+    bids = order_books(dest_orders, dest_system, is_buy=True)
+    candidates = {}
+    for type_id, type_asks in asks.items():
+        type_bids = bids.get(type_id)
+        if type_bids and type_bids[0][0] > type_asks[0][0]:
+            candidates[type_id] = profit_segments(type_asks, type_bids)
+    return candidates
+
+
+def find_candidates_in_pages(source_pages: list[bytes], source_system: int,
+                             dest_pages: list[bytes], dest_system: int) -> dict[int, list]:
+    """``find_candidates`` over raw order pages, keeping the top candidates.
+
+    Takes undecoded bodies so a worker process can do the JSON decoding too.
+    """
+    source_orders = [order for page in source_pages for order in json.loads(page)]
+    dest_orders = [order for page in dest_pages for order in json.loads(page)]
+    return top_candidates(
+        find_candidates(source_orders, source_system, dest_orders, dest_system)
+    )
+
+
+def top_candidates(candidates: dict[int, list],
+                   limit: int = MAX_HAUL_CANDIDATES) -> dict[int, list]:
+    """Keep the ``limit`` types with the most profit available in the books."""
+    if len(candidates) <= limit:
+        return candidates
+    potential = {
+        type_id: sum(units * (sell - buy) for units, buy, sell in segments)
+        for type_id, segments in candidates.items()
+    }
+    best = sorted(potential, key=potential.__getitem__, reverse=True)[:limit]
+    return {type_id: candidates[type_id] for type_id in best}
+
+
+def plan_haul(candidates: dict[int, list], volumes: dict[int, float],
+              cargo: float, capital: float) -> list[dict]:
+    """Pick what to buy within the cargo volume and capital limits.
+
+    Greedy over all profit segments, ranked by profit per unit of combined
+    resource use (share of cargo plus share of capital). Because a type's
+    segments get less profitable and more expensive as they go deeper into
+    the book, they are always taken in book order.
+    """
+    seg_type, seg_units, seg_vol, seg_buy, seg_profit, seg_score = [], [], [], [], [], []
+    for type_id, segments in candidates.items():
+        unit_vol = volumes.get(type_id, 0.0)
+        for units, buy, sell in segments:
+            profit = sell - buy
+            seg_type.append(type_id)
+            seg_units.append(units)
+            seg_vol.append(unit_vol)
+            seg_buy.append(buy)
+            seg_profit.append(profit)
+            seg_score.append(profit / (unit_vol / cargo + buy / capital))
+
+    cargo_left, capital_left = cargo, capital
+    picks = {}
+    for k in sorted(range(len(seg_score)), key=seg_score.__getitem__, reverse=True):
+        unit_vol, buy = seg_vol[k], seg_buy[k]
+        units = seg_units[k]
+        if unit_vol > 0:
+            units = min(units, int(cargo_left // unit_vol))
+        units = min(units, int(capital_left // buy))
+        if units <= 0:
+            continue
+        cargo_left -= units * unit_vol
+        capital_left -= units * buy
+        pick = picks.setdefault(seg_type[k], {
+            "type_id": seg_type[k], "units": 0, "volume": 0.0,
+            "cost": 0.0, "profit": 0.0,
+        })
+        pick["units"] += units
+        pick["volume"] += units * unit_vol
+        pick["cost"] += units * buy
+        pick["profit"] += units * seg_profit[k]
+
+    return sorted(picks.values(), key=lambda p: p["profit"], reverse=True)
+
+
+def build_haul_embed(system_name, jumps, cargo, capital, picks, names, skipped=0):
+    """Build a Discord embed dict for a haul plan.
+
+    ``skipped`` counts candidate types left out because their volume could
+    not be looked up in time.
+    """
+    total_cost = sum(p["cost"] for p in picks)
+    total_profit = sum(p["profit"] for p in picks)
+    total_volume = sum(p["volume"] for p in picks)
+    j = f" ({jumps}j)" if jumps is not None else ""
+    embed = {
+        "title": f"{system_name} → Jita{j}",
+        "color": 0x00b0f4,
+        "description": (
+            f"**Cargo:** {total_volume:,.2f} / {cargo:,.2f} m³\n"
+            f"**Capital:** {format_isk(total_cost)} / {format_isk(capital)}\n"
+            f"**Profit:** {format_isk(total_profit)} (before taxes)"
+        ),
+        "footer": {"text": "Buy from sell orders here, sell to Jita buy orders • Data from EVE ESI"},
+        "fields": [],
+    }
+    if not picks and skipped:
+        embed["description"] = (
+            f"Couldn't look up volumes for {skipped} items in time; "
+            "run again for a plan."
+        )
+    elif not picks:
+        embed["description"] = "No profitable items to haul to Jita."
+    elif skipped:
+        embed["description"] += (
+            f"\n*{skipped} items skipped while looking up volumes; "
+            "run again for a fuller plan.*"
+        )
+
+    for pick in picks[:MAX_HAUL_FIELDS]:
+        embed["fields"].append({
+            "name": names.get(pick["type_id"], str(pick["type_id"])),
+            "value": (
+                f"{pick['units']:,} units • {pick['volume']:,.2f} m³\n"
+                f"**Cost:** {format_isk(pick['cost'])}\n"
+                f"**Profit:** {format_isk(pick['profit'])}"
+            ),
+            "inline": True,
+        })
+    if len(picks) > MAX_HAUL_FIELDS:
+        rest = picks[MAX_HAUL_FIELDS:]
+        embed["fields"].append({
+            "name": f"+{len(rest)} more",
+            "value": f"**Profit:** {format_isk(sum(p['profit'] for p in rest))}",
+            "inline": False,
+        })
+    return embed
+
+
+def find_haul(system_id: int, cargo: float, capital: float) -> tuple[list[dict], dict, int]:
+    """Fetch both order books and return the haul plan and the picked type names.
+
+    Volume lookups stop at the time budget; the number of types left out
+    is returned last. Looked-up volumes are cached, so a rerun covers more.
+    """
+    deadline = time.monotonic() + HAUL_TIME_BUDGET
+    region_id, _ = get_region_for_system(system_id)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        f_source = pool.submit(
+            esi_get_pages, f"/markets/{region_id}/orders/", {"order_type": "sell"},
+        )
+        f_dest = pool.submit(
+            esi_get_pages, f"/markets/{THE_FORGE_REGION_ID}/orders/", {"order_type": "buy"},
+        )
+        source_orders = f_source.result()
+        dest_orders = f_dest.result()
+
+    candidates = top_candidates(
+        find_candidates(source_orders, system_id, dest_orders, JITA_SYSTEM_ID)
+    )
+    pool = ThreadPoolExecutor(max_workers=16)
+    futures = {pool.submit(get_type_haul_volume, type_id): type_id for type_id in candidates}
+    done, _ = wait(futures, timeout=max(deadline - time.monotonic(), 0))
+    pool.shutdown(wait=False, cancel_futures=True)
+    volumes = {futures[f]: f.result() for f in done if f.exception() is None}
+    skipped = len(candidates) - len(volumes)
+    candidates = {type_id: candidates[type_id] for type_id in volumes}
+
+    picks = plan_haul(candidates, volumes, cargo, capital)
+    names = get_type_names([p["type_id"] for p in picks]) if picks else {}
+    return picks, names, skipped
+
+
+def handle_haul_command(system: str, cargo: float, capital: str, app_id: str, token: str):
+    """Execute the /haul command and PATCH the deferred response."""
+    try:
+        check_cargo(cargo)
+        capital_isk = parse_isk(capital)
+        system_id, system_name = resolve_system_id(system)
+        picks, names, skipped = find_haul(system_id, cargo, capital_isk)
+        jumps = get_jumps(system_id, JITA_SYSTEM_ID)
+        embed = build_haul_embed(
+            system_name, jumps, cargo, capital_isk, picks, names, skipped,
+        )
+        edit_original_response(app_id, token, {"embeds": [embed]})
+
+    except ValueError as e:
+        edit_original_response(app_id, token, {"content": str(e)})
+    except Exception as e:
+        edit_original_response(app_id, token, {"content": f"ESI error: {e}"})
@@ -6,11 +6,18 @@ from utils.esi import (
     format_isk, JITA_SYSTEM_ID, THE_FORGE_REGION_ID,
 )
 from utils.discord_helpers import edit_original_response
+from utils.cache import ResultCache, with_data_age
 
+price_cache = ResultCache()
 
-def build_price_embed(type_name, volume, system_name, system_id,
-                      region_name, reg, jita, jita_jumps):
-    """Build a Discord embed dict for price results."""
+
+def build_price_embed(type_name, volume, system_name, region_name,
+                      reg, jita, jita_jumps, sell_loc, buy_loc):
+    """Build a Discord embed dict for price results.
+
+    ``sell_loc`` and ``buy_loc`` are ``(system_name, jumps)`` for the best
+    region orders, or None when there are no orders on that side.
+    """
     embed = {
         "title": type_name,
         "color": 0x00b0f4,
@@ -34,8 +41,7 @@ def build_price_embed(type_name, volume, system_name, system_id,
     # Region field with jump info and volume for best orders
     reg_lines = []
     if reg["reg_sell"] is not None:
-        jumps = get_jumps(system_id, reg["reg_sell_system"])
-        loc = get_system_name(reg["reg_sell_system"])
+        loc, jumps = sell_loc
         j = f" ({jumps}j)" if jumps is not None else ""
         reg_lines.append(
             f"**Sell:** {format_isk(reg['reg_sell'])}\n"
@@ -44,8 +50,7 @@ def build_price_embed(type_name, volume, system_name, system_id,
     else:
         reg_lines.append("**Sell:** No orders")
     if reg["reg_buy"] is not None:
-        jumps = get_jumps(system_id, reg["reg_buy_system"])
-        loc = get_system_name(reg["reg_buy_system"])
+        loc, jumps = buy_loc
         j = f" ({jumps}j)" if jumps is not None else ""
         reg_lines.append(
             f"**Buy:** {format_isk(reg['reg_buy'])}\n"
@@ -91,30 +96,73 @@ def build_price_embed(type_name, volume, system_name, system_id,
     return embed
 
 
+def order_location(system_id, order_system_id):
+    """Return ``(system_name, jumps)`` for an order's system, or None."""
+    if order_system_id is None:
+        return None
+    return get_system_name(order_system_id), get_jumps(system_id, order_system_id)
+
+
+def fetch_price_result(system_id, system_name, type_id, type_name):
+    """Run the ESI lookups for /price and return the embed with its prices.
+
+    Also returns whether all order pages were fetched; partial results are
+    fine to show but must not be cached.
+    """
+    region_id, region_name = get_region_for_system(system_id)
+
+    # Parallelize independent ESI calls
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        f_reg = pool.submit(get_best_prices, region_id, type_id, system_id)
+        f_jita = pool.submit(get_best_prices, THE_FORGE_REGION_ID, type_id, JITA_SYSTEM_ID)
+        f_volume = pool.submit(get_type_volume, type_id)
+        f_jumps = pool.submit(get_jumps, system_id, JITA_SYSTEM_ID)
+
+        reg, reg_complete = f_reg.result()
+        jita, jita_complete = f_jita.result()
+        volume = f_volume.result()
+        jita_jumps = f_jumps.result()
+
+    embed = build_price_embed(
+        type_name, volume, system_name, region_name, reg, jita, jita_jumps,
+        order_location(system_id, reg["reg_sell_system"]),
+        order_location(system_id, reg["reg_buy_system"]),
+    )
+    return {"embed": embed, "reg": reg, "jita": jita}, reg_complete and jita_complete
+
+
 def handle_price_command(system: str, item: str, app_id: str, token: str):
     """Execute the /price command and PATCH the deferred response."""
     try:
         system_id, system_name = resolve_system_id(system)
         type_id, type_name = resolve_type_id(item)
-        region_id, region_name = get_region_for_system(system_id)
-
-        # Parallelize independent ESI calls
-        with ThreadPoolExecutor(max_workers=4) as pool:
-            f_reg = pool.submit(get_best_prices, region_id, type_id, system_id)
-            f_jita = pool.submit(get_best_prices, THE_FORGE_REGION_ID, type_id, JITA_SYSTEM_ID)
-            f_volume = pool.submit(get_type_volume, type_id)
-            f_jumps = pool.submit(get_jumps, system_id, JITA_SYSTEM_ID)
-
-            reg = f_reg.result()
-            jita = f_jita.result()
-            volume = f_volume.result()
-            jita_jumps = f_jumps.result()
-
-        embed = build_price_embed(
-            type_name, volume, system_name, system_id,
-            region_name, reg, jita, jita_jumps,
-        )
-        edit_original_response(app_id, token, {"embeds": [embed]})
+        key = (system_id, type_id)
+
+        cached = price_cache.get(key)
+        if cached is not None:
+            result, age = cached
+            edit_original_response(
+                app_id, token, {"embeds": [with_data_age(result["embed"], age)]},
+            )
+            # Stale hit: the reply is already sent, so refresh afterwards
+            # while this invocation is still alive.
+            if not price_cache.is_fresh(age) and price_cache.begin_refresh(key):
+                try:
+                    result, complete = fetch_price_result(
+                        system_id, system_name, type_id, type_name,
+                    )
+                    if complete:
+                        price_cache.set(key, result)
+                except Exception:
+                    pass  # keep serving the stale entry; the reply is already out
+                finally:
+                    price_cache.end_refresh(key)
+            return
+
+        result, complete = fetch_price_result(system_id, system_name, type_id, type_name)
+        if complete:
+            price_cache.set(key, result)
+        edit_original_response(app_id, token, {"embeds": [result["embed"]]})
 
     except ValueError as e:
         edit_original_response(app_id, token, {"content": str(e)})
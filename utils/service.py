@@ -0,0 +1,195 @@
+"""Shared ESI worker service, spoken to over a Unix socket.
+
+One service process owns the HTTP session, caches and rate limiting for
+every bot shard process on the host, and runs order reductions in a
+process pool. Requests and responses are newline-delimited JSON:
+``{"id", "method", "args"}`` in, ``{"id", "result"}`` or ``{"id", "error"}`` out.
+"""
+
+import asyncio
+import functools
+import itertools
+import json
+import os
+import stat
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import esi_async
+from utils.cache import private_dir, user_temp_dir
+
+SERVICE_METHODS = {
+    "resolve_system_id": esi_async.resolve_system_id,
+    "resolve_type_id": esi_async.resolve_type_id,
+    "price_result": esi_async.price_result,
+    "haul_embed": esi_async.haul_embed,
+}
+LINE_LIMIT = 2 ** 20
+# Seconds a bot waits for the service; well under the 15 minute
+# interaction follow-up window.
+CALL_TIMEOUT = 300
+
+
+def default_socket_path() -> str:
+    """Return ``ESI_SERVICE_SOCKET``, or a socket in this user's private temp dir."""
+    if os.environ.get("ESI_SERVICE_SOCKET"):
+        return os.environ["ESI_SERVICE_SOCKET"]
+    return os.path.join(private_dir(user_temp_dir()), "esi.sock")
+
+
+# --- Server ---
+
+async def _handle_request(line: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request["id"]
+        method = SERVICE_METHODS[request["method"]]
+    except (ValueError, KeyError, TypeError) as e:
+        response = {"id": request_id, "error": f"Bad request: {e}"}
+    else:
+        try:
+            result = await method(*request["args"])
+            response = {"id": request_id, "result": result}
+        except ValueError as e:
+            response = {"id": request_id, "error": str(e), "user_error": True}
+        except Exception as e:
+            response = {"id": request_id, "error": str(e)}
+    async with write_lock:
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+
+
+async def _handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    write_lock = asyncio.Lock()
+    tasks = set()
+    try:
+        while line := await reader.readline():
+            task = asyncio.create_task(_handle_request(line, writer, write_lock))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        for task in tasks:
+            task.cancel()
+        writer.close()
+
+
+async def _remove_stale_socket(path: str):
+    """Remove a socket left behind by a dead service.
+
+    Refuses if ``path`` is not a socket or another service still answers on it.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f"Not a socket, refusing to replace: {path}")
+    try:
+        _, writer = await asyncio.open_unix_connection(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+        return
+    writer.close()
+    raise RuntimeError(f"An ESI service is already running on {path}")
+
+
+async def serve(path: str, processes: int | None = None):
+    """Run the service on ``path`` until cancelled."""
+    await _remove_stale_socket(path)
+    with ProcessPoolExecutor(processes) as pool:
+        await esi_async.open_session(pool)
+        # Create the socket owner-only from the start rather than chmod-ing it.
+        old_umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(
+                _handle_connection, path, limit=LINE_LIMIT,
+            )
+        finally:
+            os.umask(old_umask)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await esi_async.close_session()
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+# --- Client ---
+
+class ServiceClient:
+    """Calls the ESI worker service over its Unix socket.
+
+    Exposes the coroutines in ``SERVICE_METHODS`` under the same names as
+    ``utils.esi_async``, so either can back the bot. Many calls share one
+    connection; it is reopened on the next call if it drops.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._connect_lock = asyncio.Lock()
+        self._read_task: asyncio.Task | None = None
+
+    async def _connect(self):
+        async with self._connect_lock:
+            if self._writer is None or self._writer.is_closing():
+                self._reader, self._writer = await asyncio.open_unix_connection(
+                    self.path, limit=LINE_LIMIT,
+                )
+                self._read_task = asyncio.create_task(
+                    self._read_responses(self._reader, self._writer)
+                )
+
+    async def _read_responses(self, reader: asyncio.StreamReader,
+                              writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                response = json.loads(line)
+                future = self._pending.pop(response["id"], None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            # Close the socket even if reading failed, so the service stops
+            # writing to a connection nobody reads.
+            writer.close()
+            if self._reader is reader:
+                self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("ESI service connection lost"))
+            self._pending.clear()
+
+    async def call(self, method: str, *args):
+        await self._connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        request = {"id": request_id, "method": method, "args": list(args)}
+        try:
+            self._writer.write(json.dumps(request).encode() + b"\n")
+            await self._writer.drain()
+            response = await asyncio.wait_for(future, CALL_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError("ESI service did not respond in time") from None
+        finally:
+            self._pending.pop(request_id, None)
+        if "error" in response:
+            if response.get("user_error"):
+                raise ValueError(response["error"])
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def __getattr__(self, name: str):
+        if name not in SERVICE_METHODS:
+            raise AttributeError(name)
+        return functools.partial(self.call, name)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._read_task is not None:
+            await asyncio.gather(self._read_task, return_exceptions=True)